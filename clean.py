@@ -6,27 +6,18 @@
 import fitz
 import pytesseract
 from PIL import Image
-import io
 import os
 import re
+import shutil
 import sys
 import argparse
-
-# ---------- user params ----------
-parser = argparse.ArgumentParser(description="PDF clean: fix Celsius + mark complex formulas per rules")
-parser.add_argument("input_pdf", help="input pdf file")
-parser.add_argument("--dpi", type=int, default=200, help="render DPI for page images")
-parser.add_argument("--out_txt", default=None, help="output txt filename (optional)")
-parser.add_argument("--img_dir", default=None, help="directory to save page images / formula images (optional)")
-args = parser.parse_args()
-
-INPUT_PDF = args.input_pdf
-BASE = os.path.splitext(os.path.basename(INPUT_PDF))[0]
-OUT_TXT = args.out_txt or f"{BASE}-cleaned.txt"
-IMG_DIR = args.img_dir or f"{BASE}_pageimgs"
-DPI = args.dpi
-
-os.makedirs(IMG_DIR, exist_ok=True)
+import queue
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import chain
 
 # regexes to detect math-like inline text (simple heuristics)
 MATH_SYMBOLS = r"[=<>≈≤≥±×÷∑∏∫√∞°πμσΔλαβγθφψω/\\^{}_]"
@@ -39,18 +30,49 @@ MATH_TOKENS = [
 ]
 MATH_COMBINED = "(" + ")|(".join(MATH_TOKENS) + ")"
 CHINESE_CHAR_PATTERN = re.compile("[\u3400-\u4DBF\u4E00-\u9FFF\uf900-\ufaff\U00020000-\U0002CEAF\U0002F800-\U0002FA1F]")
-SPACED_CAPS_PATTERN = re.compile(r"\b(?:[A-Z]\s+){2,}[A-Z]\b")
+# same matches as \b(?:[A-Z]\s+){2,}[A-Z]\b, but leading with a literal [A-Z] lets
+# the regex engine skip straight to candidate capitals instead of testing \b everywhere
+SPACED_CAPS_PATTERN = re.compile(r"[A-Z](?=\s)(?<!\w[A-Z])(?:\s+[A-Z]){2,}\b")
+_MATH_RE = re.compile(MATH_COMBINED)
+# every MATH_TOKENS alternative contains one of these characters, so text without
+# any of them can never match; checked with a C-level set test before the regex
+_MATH_CHARSET = frozenset("=<>≈≤≥±×÷∑∏∫√∞°πμσΔλαβγθφψω/\\^{}_")
+# a whole line of cleaned page text that is math-like and longer than 5 chars once stripped
+_MATH_LINE_RE = re.compile(rf"^(?=[^\S\n]*\S.{{5}}).*?(?:{MATH_COMBINED}).*$", re.MULTILINE)
+_CELSIUS_RE = re.compile(r"\ufffd+C")
+# line-level cleaners, applied to a whole page at once (re.MULTILINE); [^\S\n]
+# is used instead of \s so no match can run into the next line
+_TRAILING_WS_RE = re.compile(r"[^\S\n]+$", re.MULTILINE)
+_HEADING_RE = re.compile(r"^[^\S\n]*\d+\.[^\S\n]+([A-Za-z].*)$", re.MULTILINE)
+_DROP_RE = re.compile(
+    r"^[^\S\n]*(?:figure[ :]|fig[ .:]|table[ .:]"  # captions
+    r"|[\-\u2022•▪◦‣♦]+[^\S\n]"  # bullets
+    r"|\(?[a-z]\)[^\S\n]"  # (a) list items
+    r"|\d+[\.\)](?:[^\S\n]+(?-i:[a-z])|[^\S\n]*$)).*$",  # "1) item" / bare numbers
+    re.IGNORECASE | re.MULTILINE,
+)
 
 # URL detection pattern - more specific to avoid false positives
 URL_PATTERN = re.compile(
     r'https?://[^\s]+|'  # http:// or https://
     r'www\.[a-zA-Z0-9][a-zA-Z0-9-]*\.[^\s]+|'  # www.domain...
-    r'(?:doi\.org/|doi:\s*)[^\s]+'  # DOI links
+    r'(?:doi\.org/|doi:[^\S\n]*)[^\s]+'  # DOI links (never across a line break)
+)
+
+# ARTICLE INFO section: the first ABSTRACT line splits title region from body,
+# a metadata heading ends the title, and noisy lines are dropped from the title
+_ABSTRACT_RE = re.compile(r"(?mi)^[^\n]*ABSTRACT")
+_ARTICLE_INFO_RE = re.compile(r"(?mi)^[^\n]*(?:ARTICLE INFO|ARTICLE HISTORY|KEYWORDS)")
+_TITLE_NOISE_RE = re.compile(
+    r"(?mi)^[^\n]*(?:received:|accepted:|published:|doi:|doi\.org|keywords:|copyright|©|"
+    r"elsevier|springer|all rights reserved|article history|available online|"
+    r"e-mail:|email:|correspondence:|@|(?-i:" + URL_PATTERN.pattern + r"))[^\n]*$"
 )
 
 
 def remove_chinese_characters(text):
-    if not text:
+    # pure-ASCII text (the common case) cannot contain CJK; isascii() is a C-level check
+    if not text or text.isascii():
         return text
     return CHINESE_CHAR_PATTERN.sub("", text)
 
@@ -68,35 +90,6 @@ def collapse_spaced_capital_sequences(text):
     return SPACED_CAPS_PATTERN.sub(lambda match: match.group(0).replace(" ", ""), text)
 
 
-def remove_numeric_heading_prefix(line):
-    if not line:
-        return line
-    match = re.match(r"^\s*\d+\.\s+([A-Za-z].*)$", line)
-    if match:
-        return match.group(1)
-    return line
-
-
-def should_drop_line(line):
-    if not line:
-        return False
-    stripped = line.strip()
-    if not stripped:
-        return False
-    lower = stripped.lower()
-    if lower.startswith(("figure ", "figure:", "fig ", "fig.", "fig:", "table ", "table.", "table:")):
-        return True
-    if re.match(r"^[\-\u2022•▪◦‣♦]+\s+", stripped):
-        return True
-    if re.match(r"^\(?[a-z]\)\s+", stripped.lower()):
-        return True
-    if re.match(r"^\d+[\.\)]\s+[a-z]", stripped):
-        return True
-    if re.match(r"^\d+[\.\)]\s*$", stripped):
-        return True
-    return False
-
-
 def clean_article_info_section(text):
     """
     Remove ARTICLE INFO section and keep only title before ABSTRACT.
@@ -106,183 +99,386 @@ def clean_article_info_section(text):
     if not text:
         return text
 
-    lines = text.split('\n')
-    cleaned_lines = []
-    title_lines = []
-    found_abstract = False
-    skip_until_abstract = False
-    collecting_title = True
-
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-        upper = stripped.upper()
-
-        # Detect ABSTRACT section
-        if 'ABSTRACT' in upper and not found_abstract:
-            found_abstract = True
-            skip_until_abstract = False
-            collecting_title = False
-            # Add collected title lines
-            if title_lines:
-                cleaned_lines.extend(title_lines)
-                cleaned_lines.append('')  # blank line after title
-            cleaned_lines.append(line)
-            continue
-
-        # Detect ARTICLE INFO or similar metadata sections
-        if not found_abstract and any(keyword in upper for keyword in
-                                     ['ARTICLE INFO', 'ARTICLE INFORMATION',
-                                      'ARTICLE HISTORY', 'KEYWORDS']):
-            skip_until_abstract = True
-            collecting_title = False
-            continue
-
-        # If we're before ABSTRACT and should skip
-        if not found_abstract and skip_until_abstract:
-            continue
-
-        # If we haven't found ABSTRACT yet and not skipping, collect title lines
-        if not found_abstract and not skip_until_abstract and collecting_title:
-            if stripped:
-                # Avoid collecting metadata-like lines
-                if not any(keyword in stripped.lower() for keyword in
-                          ['received:', 'accepted:', 'published:', 'doi:', 'doi.org',
-                           'keywords:', 'copyright', '©', 'elsevier', 'springer',
-                           'all rights reserved', 'article history', 'available online',
-                           'e-mail:', 'email:', 'correspondence:', '@']):
-                    # Also check if line contains URLs
-                    if not URL_PATTERN.search(stripped):
-                        title_lines.append(line)
-            continue
-
-        # After finding ABSTRACT, add all lines (with URLs removed)
-        if found_abstract:
-            # Remove URLs from the line before adding
-            cleaned_line = remove_urls(line)
-            cleaned_lines.append(cleaned_line)
-
+    match = _ABSTRACT_RE.search(text)
     # If ABSTRACT was never found, return original text with URLs removed
-    if not found_abstract:
-        result_lines = []
-        for line in lines:
-            cleaned_line = remove_urls(line)
-            if cleaned_line.strip():
-                result_lines.append(cleaned_line)
-        return '\n'.join(result_lines)
+    if not match:
+        return '\n'.join(line for line in remove_urls(text).split('\n') if line.strip())
 
-    return '\n'.join(cleaned_lines)
+    # Title: lines before ABSTRACT, up to any ARTICLE INFO or similar metadata section,
+    # without metadata-like lines or URLs
+    head = text[:match.start()]
+    info = _ARTICLE_INFO_RE.search(head)
+    title_region = head[:info.start()] if info else head
+    title_lines = [line for line in _TITLE_NOISE_RE.sub('', title_region).split('\n') if line.strip()]
 
+    # Body: the ABSTRACT line as is, then everything after it with URLs removed
+    line_end = text.find('\n', match.start())
+    body = text[match.start():] if line_end < 0 else text[match.start():line_end] + remove_urls(text[line_end:])
+
+    if title_lines:
+        return '\n'.join(title_lines) + '\n\n' + body  # blank line after title
+    return body
 
-# helper: render page to png bytes
-def render_page_png(page, dpi=DPI):
-    mat = fitz.Matrix(dpi/72, dpi/72)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
-    return pix.tobytes("png")
 
-# helper: OCR image bytes to text
-def ocr_image_bytes(img_bytes, lang=None):
-    img = Image.open(io.BytesIO(img_bytes))
+# helper: render page to an RGB pixmap (PNG encoding is left to the callers that need it)
+def render_page_pixmap(page, dpi=200):
+    mat = fitz.Matrix(dpi/72, dpi/72)
+    return page.get_pixmap(matrix=mat, alpha=False)
+
+# LSTM engine only, one uniform text block: skips Tesseract's layout analysis
+OCR_CONFIG = "--oem 1 --psm 6"
+# pages per tesseract run; the model is loaded once per batch instead of once per page
+OCR_BATCH = 16
+# one OpenMP thread per tesseract process: parallelism comes from the worker pool,
+# and several threads per process would oversubscribe the cores
+OCR_THREAD_LIMIT = {"OMP_THREAD_LIMIT": "1"}
+
+# helper: OCR a PIL image to text
+def ocr_image(img, lang=None):
     # you can set pytesseract.pytesseract.tesseract_cmd if needed
     if lang:
-        return pytesseract.image_to_string(img, lang=lang)
-    return pytesseract.image_to_string(img)
+        return pytesseract.image_to_string(img, lang=lang, config=OCR_CONFIG)
+    return pytesseract.image_to_string(img, config=OCR_CONFIG)
+
+# helper: OCR several image files with one tesseract run (file-list input).
+# Returns one text per path, in order.
+def ocr_files(paths, workdir, lang=None):
+    list_path = os.path.join(workdir, "batch.txt")
+    with open(list_path, "w", encoding="utf-8") as lf:
+        lf.write("\n".join(paths) + "\n")
+    stem = os.path.join(workdir, "ocr")
+    cmd = [pytesseract.pytesseract.tesseract_cmd, list_path, stem] + OCR_CONFIG.split()
+    if lang:
+        cmd += ["-l", lang]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, env={**os.environ, **OCR_THREAD_LIMIT})
+    except FileNotFoundError:
+        raise pytesseract.TesseractNotFoundError() from None
+    except subprocess.CalledProcessError as exc:
+        # surface tesseract's own message (missing language pack, tessdata path, ...)
+        raise pytesseract.TesseractError(exc.returncode, exc.stderr.decode(errors="replace").strip()) from None
+    with open(stem + ".txt", encoding="utf-8") as tf:
+        texts = tf.read().split("\f")
+    # pages are separated by a form feed; some tesseract versions also end the file with one
+    if len(texts) == len(paths) + 1 and not texts[-1].strip():
+        texts.pop()
+    if len(texts) != len(paths):
+        # unexpected layout: fall back to one OCR call per page; PIL reads the PPM
+        # files itself, since this may run off the thread that owns the PyMuPDF context;
+        # pytesseract starts tesseract with this process's environment
+        os.environ.update(OCR_THREAD_LIMIT)
+        texts = []
+        for path in paths:
+            with Image.open(path) as img:
+                texts.append(ocr_image(img, lang=lang))
+    return texts
+
+# helper: one-shot binary write straight to a file descriptor (no buffered file object)
+def _write_bytes(path, data):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+# a vector drawing with curves or more than this many path segments may be a formula
+# drawn as outlines, which only shows up in the rendered raster
+COMPLEX_PATH_ITEMS = 4
+
+# helper: detect vector drawings complex enough to hide a formula from text extraction
+def has_complex_drawings(page):
+    for drawing in page.get_drawings():
+        items = drawing["items"]
+        if len(items) > COMPLEX_PATH_ITEMS or any(item[0] == "c" for item in items):
+            return True
+    return False
 
 # helper: simple detection if a text snippet is math-like
 def is_math_like(snippet):
-    if not snippet:
+    if not snippet or _MATH_CHARSET.isdisjoint(snippet):
         return False
-    return re.search(MATH_COMBINED, snippet) is not None
-
-# open pdf and process page by page
-formula_counter = 0
-formula_records = []  # list of dicts: {id, page, imgfile, ocr_text, note}
-collected_segments = []
-with fitz.open(INPUT_PDF) as pdf:
-    total_pages = pdf.page_count
-    for pno in range(total_pages):
-        page = pdf.load_page(pno)
-        page_text = page.get_text("text")  # preserve extracted text exactly
-        # 1) minimal replacement: fix Celsius garble (but preserve everything else)
-        # count replacements for reporting
-        count_direct = page_text.count("��C")
-        if count_direct > 0:
-            page_text = page_text.replace("��C", "°C")
-        # also replace other �+C patterns conservatively in extracted text
-        page_text = re.sub(r"�+C", "°C", page_text)
-        page_text = remove_chinese_characters(page_text)
-        page_text = collapse_spaced_capital_sequences(page_text)
-        page_text = page_text.replace("\r\n", "\n")
-        cleaned_lines = []
-        for raw_line in page_text.splitlines():
-            line = raw_line.rstrip()
-            if should_drop_line(line):
-                continue
-            line = remove_numeric_heading_prefix(line)
-            line = collapse_spaced_capital_sequences(line)
-            if CHINESE_CHAR_PATTERN.search(line):
-                line = remove_chinese_characters(line)
-            if line.strip():
-                cleaned_lines.append(line)
-        page_text = "\n".join(cleaned_lines).strip("\n")
-        if page_text:
-            collected_segments.append(page_text)
-
-        # Render page image and save (for manual review and for formula-image detection)
-        img_bytes = render_page_png(page, dpi=DPI)
-        page_imgname = os.path.join(IMG_DIR, f"page_{pno+1}.png")
-        with open(page_imgname, "wb") as imf:
-            imf.write(img_bytes)
-
-        # OCR the page image to catch text inside images (e.g., formula images)
-        ocr_text = ocr_image_bytes(img_bytes)
-        # quick normalization
-        ocr_trim = remove_chinese_characters(ocr_text.strip())
-
-        # Heuristic 1: if OCR contains math-like tokens not present in page_text,
-        # consider there are image-formulas or text missing in extracted text.
-        ocr_has_math = is_math_like(ocr_trim)
-        ocr_differs = (len(ocr_trim) > 50) and (ocr_trim not in page_text)
-
-        # Heuristic 2: scan the extracted page_text for formula-like inline blocks that are complex:
-        # e.g., lines containing many math symbols, or contiguous lines with fraction patterns.
-        complex_formula_lines = []
-        for i, line in enumerate(page_text.splitlines()):
-            if is_math_like(line) and len(line.strip()) > 5:
-                # mark as math-like line; further heuristics could be applied
-                complex_formula_lines.append((i+1, line))
-
-        # If OCR suggests a formula image or extracted text has complex formula-like lines
-        if ocr_has_math or ocr_differs or complex_formula_lines:
-            # For safety, we will mark the page image as potential formula container.
-            # Create a formula record referencing page image and OCR text.
-            formula_counter += 1
-            fid = formula_counter
-            imgfile = os.path.join(IMG_DIR, f"formula_{BASE}_p{pno+1}_{fid}.png")
-            # save the same page image as a "formula image" for convenience (user can crop later)
-            with open(imgfile, "wb") as fimg:
-                fimg.write(img_bytes)
-
-            # Compose placeholder and explanation block according to your rules:
-            collected_segments.append("<formula>")
-
-            # record
-            formula_records.append({
-                "id": fid,
-                "page": pno+1,
-                "imgfile": imgfile,
-                "ocr": ocr_trim,
-                "lines": complex_formula_lines
-            })
-
-# write collected text to output file following sample format
-with open(OUT_TXT, "w", encoding="utf-8") as out_f:
-    out_f.write("\n\n".join(segment for segment in collected_segments if segment))
-
-# final report printed to console
-print("✅ Processing complete.")
-print(f"Input PDF: {INPUT_PDF}")
-print(f"Output TXT: {OUT_TXT}")
-print(f"Page images and formula images saved under: {IMG_DIR}")
-print(f"Detected complex formula blocks: {len(formula_records)}")
-for rec in formula_records:
-    print(f"  - Formula {rec['id']} on page {rec['page']}, image: {rec['imgfile']}, OCR len: {len(rec['ocr'])}")
+    return _MATH_RE.search(snippet) is not None
+
+# helper: Celsius fix + line-level cleaning of extracted page text
+def clean_page_text(page_text):
+    # 1) minimal replacement: fix Celsius garble (but preserve everything else);
+    # �+C covers the common ��C case, and most pages contain no � at all
+    if "\ufffd" in page_text:
+        page_text = _CELSIUS_RE.sub("°C", page_text)
+    page_text = remove_chinese_characters(page_text)
+    page_text = collapse_spaced_capital_sequences(page_text)
+    page_text = "\n".join(page_text.splitlines())
+    page_text = _TRAILING_WS_RE.sub("", page_text)
+    page_text = _DROP_RE.sub("", page_text)
+    page_text = _HEADING_RE.sub(r"\1", page_text)
+    return "\n".join([line for line in page_text.splitlines() if line.strip()])
+
+# per-worker state, set by _init_worker (PyMuPDF documents are not fork-safe,
+# so every worker process opens its own handle)
+_worker_pdf = None
+_worker_dpi = None
+_worker_ocr_dpi = None
+_worker_img_dir = None
+_worker_save_page_images = False
+
+def _init_worker(input_pdf, dpi, ocr_dpi, img_dir, save_page_images):
+    global _worker_pdf, _worker_dpi, _worker_ocr_dpi, _worker_img_dir, _worker_save_page_images
+    _worker_pdf = fitz.open(input_pdf)
+    _worker_dpi = dpi
+    _worker_ocr_dpi = ocr_dpi
+    _worker_img_dir = img_dir
+    _worker_save_page_images = save_page_images
+
+# helper: extract and (when needed) render a batch of pages; pnos is a contiguous
+# range of page numbers. Pages that need OCR are rendered to PPM files in workdir.
+# Returns (pages, ocr_paths).
+def _prepare_pages(pnos, workdir):
+    pages = []
+    ocr_paths = []
+    for pno, page in zip(pnos, _worker_pdf.pages(pnos.start, pnos.stop)):
+        page_text = clean_page_text(page.get_text("text"))  # preserve extracted text exactly
+
+        # fast path: a page without raster images, math-like or garbled text and
+        # complex vector drawings cannot hide a formula, so skip rendering and OCR
+        # altogether; get_drawings() is the costliest test, so it runs last
+        needs_ocr = (bool(page.get_images(full=False)) or is_math_like(page_text)
+                     or "\ufffd" in page_text or has_complex_drawings(page))
+
+        # OCR input, rendered at the (usually lower) OCR resolution
+        ocr_path = None
+        if needs_ocr:
+            ocr_path = os.path.join(workdir, f"page_{pno+1}.ppm")
+            render_page_pixmap(page, dpi=_worker_ocr_dpi).save(ocr_path)
+            ocr_paths.append(ocr_path)
+        pages.append((pno, page, page_text, ocr_path))
+    return pages, ocr_paths
+
+# helper: OCR the prepared page images to catch text inside images (e.g., formula images)
+def _ocr_pages(ocr_paths, workdir):
+    return ocr_files(ocr_paths, workdir) if ocr_paths else []
+
+def _finish_pages(pages, ocr_paths, ocr_texts):
+    ocr_by_path = dict(zip(ocr_paths, ocr_texts))
+    return [_finish_page(pno, page, page_text, ocr_by_path.get(ocr_path, ""), ocr_path)
+            for pno, page, page_text, ocr_path in pages]
+
+# helper: extract, render and OCR a batch of pages; runs inside a worker process.
+# Pages that need OCR are OCR'd by a single tesseract run.
+def process_pages(pnos):
+    with tempfile.TemporaryDirectory() as workdir:
+        pages, ocr_paths = _prepare_pages(pnos, workdir)
+        return _finish_pages(pages, ocr_paths, _ocr_pages(ocr_paths, workdir))
+
+# helper: single-process alternative to process_pages over a worker pool. This thread
+# extracts and renders the next batch while a background thread waits on tesseract
+# for the previous one; all PyMuPDF calls stay on this thread. Yields page results
+# in page order.
+def pipeline_pages(batches):
+    to_ocr = queue.Queue(maxsize=2)  # rendered batches waiting for OCR
+    ocr_done = queue.Queue()
+    stop = threading.Event()  # OCR failed or the consumer went away
+
+    def ocr_loop():
+        while True:
+            item = to_ocr.get()
+            if item is None:
+                ocr_done.put(None)
+                return
+            if stop.is_set():
+                continue  # keep draining to_ocr so the producer never blocks
+            pages, ocr_paths, workdir = item
+            try:
+                ocr_done.put((pages, ocr_paths, workdir, _ocr_pages(ocr_paths, workdir)))
+            except Exception as exc:
+                stop.set()
+                ocr_done.put(exc)
+
+    def finish(item):
+        if isinstance(item, Exception):
+            raise item
+        pages, ocr_paths, workdir, ocr_texts = item
+        results = _finish_pages(pages, ocr_paths, ocr_texts)
+        shutil.rmtree(workdir, ignore_errors=True)
+        return results
+
+    with tempfile.TemporaryDirectory() as tmp_root:
+        ocr_thread = threading.Thread(target=ocr_loop, daemon=True)
+        ocr_thread.start()
+        try:
+            for pnos in batches:
+                if stop.is_set():
+                    break  # OCR failed: render nothing more, the error is raised below
+                workdir = tempfile.mkdtemp(dir=tmp_root)
+                to_ocr.put((*_prepare_pages(pnos, workdir), workdir))
+                # finish whatever OCR has completed in the meantime
+                while True:
+                    try:
+                        item = ocr_done.get_nowait()
+                    except queue.Empty:
+                        break
+                    yield from finish(item)
+            to_ocr.put(None)
+            while True:
+                item = ocr_done.get()
+                if item is None:
+                    break
+                yield from finish(item)
+        finally:
+            # also reached on an error or an early close: tesseract must be done
+            # with tmp_root before it is removed
+            stop.set()
+            to_ocr.put(None)
+            ocr_thread.join()
+
+# helper: formula heuristics and image output for one page, given its OCR text.
+# Returns (pno, page_text, ocr_trim, img_bytes, complex_formula_lines, is_formula);
+# img_bytes is only sent back when the page is a formula candidate and no page image was saved.
+def _finish_page(pno, page, page_text, ocr_text, ocr_path):
+    # quick normalization
+    ocr_trim = remove_chinese_characters(ocr_text.strip())
+
+    # Heuristic 1: if OCR contains math-like tokens not present in page_text,
+    # consider there are image-formulas or text missing in extracted text.
+    ocr_has_math = is_math_like(ocr_trim)
+    # (token-set membership instead of a substring scan of page_text)
+    page_tokens = set(page_text.split())
+    ocr_tokens = ocr_trim.split()
+    ocr_differs = len(ocr_tokens) > 20 and sum(1 for t in ocr_tokens if t not in page_tokens) / len(ocr_tokens) > 0.5
+
+    # Heuristic 2: scan the extracted page_text for formula-like inline blocks that are complex:
+    # e.g., lines containing many math symbols, or contiguous lines with fraction patterns.
+    complex_formula_lines = []
+    lineno, pos = 1, 0
+    matches = () if _MATH_CHARSET.isdisjoint(page_text) else _MATH_LINE_RE.finditer(page_text)
+    for m in matches:
+        # mark as math-like line; further heuristics could be applied
+        lineno += page_text.count("\n", pos, m.start())
+        pos = m.start()
+        complex_formula_lines.append((lineno, m.group(0)))
+
+    is_formula = bool(ocr_has_math or ocr_differs or complex_formula_lines)
+
+    # Render page image and save (for manual review and for formula-image detection);
+    # reuse the OCR render when both resolutions agree
+    pix = None
+    if is_formula or _worker_save_page_images:
+        if ocr_path and _worker_ocr_dpi == _worker_dpi:
+            pix = fitz.Pixmap(ocr_path)
+        else:
+            pix = render_page_pixmap(page, dpi=_worker_dpi)
+    if _worker_save_page_images:
+        pix.save(os.path.join(_worker_img_dir, f"page_{pno+1}.png"))
+
+    # PNG-encode only what the parent will write out as a formula image
+    # (a saved page image is linked by the parent instead)
+    img_bytes = pix.tobytes("png") if is_formula and not _worker_save_page_images else None
+    return pno, page_text, ocr_trim, img_bytes, complex_formula_lines, is_formula
+
+
+# argparse type: an integer of at least 1
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def main():
+    # ---------- user params ----------
+    parser = argparse.ArgumentParser(description="PDF clean: fix Celsius + mark complex formulas per rules")
+    parser.add_argument("input_pdf", help="input pdf file")
+    parser.add_argument("--dpi", type=int, default=200, help="render DPI for page images")
+    parser.add_argument("--ocr_dpi", type=int, default=150, help="render DPI for the OCR pass")
+    parser.add_argument("--out_txt", default=None, help="output txt filename (optional)")
+    parser.add_argument("--img_dir", default=None, help="directory to save page images / formula images (optional)")
+    parser.add_argument("--save-page-images", action="store_true", help="also save every rendered page as page_<n>.png")
+    parser.add_argument("--workers", type=positive_int, default=None, help="number of OCR worker processes (default: CPU count); "
+                        "1 runs in-process, overlapping rendering with OCR")
+    args = parser.parse_args()
+
+    INPUT_PDF = args.input_pdf
+    BASE = os.path.splitext(os.path.basename(INPUT_PDF))[0]
+    OUT_TXT = args.out_txt or f"{BASE}-cleaned.txt"
+    IMG_DIR = args.img_dir or f"{BASE}_pageimgs"
+    DPI = args.dpi
+    OCR_DPI = args.ocr_dpi
+    WORKERS = args.workers or os.cpu_count() or 1
+    SAVE_PAGE_IMAGES = args.save_page_images
+
+    os.makedirs(IMG_DIR, exist_ok=True)
+
+    # process pages in parallel, in batches of up to OCR_BATCH pages but small
+    # enough that every worker gets one; results arrive in page order, and each
+    # page is written to the output file (segments separated by a blank line)
+    # as soon as it arrives
+    formula_counter = 0
+    formula_records = []  # list of dicts: {id, page, imgfile, ocr_text, note}
+    with fitz.open(INPUT_PDF) as pdf:
+        total_pages = pdf.page_count
+    batch_size = max(1, min(OCR_BATCH, -(-total_pages // WORKERS)))
+    batches = [range(start, min(start + batch_size, total_pages)) for start in range(0, total_pages, batch_size)]
+    sep = ""
+    with open(OUT_TXT, "w", encoding="utf-8") as out_f, ExitStack() as stack:
+        if WORKERS > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=WORKERS, initializer=_init_worker,
+                                                           initargs=(INPUT_PDF, DPI, OCR_DPI, IMG_DIR, SAVE_PAGE_IMAGES)))
+            results = chain.from_iterable(pool.map(process_pages, batches))
+        else:
+            _init_worker(INPUT_PDF, DPI, OCR_DPI, IMG_DIR, SAVE_PAGE_IMAGES)
+            stack.callback(lambda: _worker_pdf.close())
+            results = pipeline_pages(batches)
+        for pno, page_text, ocr_trim, img_bytes, complex_formula_lines, is_formula in results:
+            if page_text:
+                out_f.write(sep)
+                out_f.write(page_text)
+                sep = "\n\n"
+
+            # If OCR suggests a formula image or extracted text has complex formula-like lines
+            if is_formula:
+                # For safety, we will mark the page image as potential formula container.
+                # Create a formula record referencing page image and OCR text.
+                formula_counter += 1
+                fid = formula_counter
+                imgfile = os.path.join(IMG_DIR, f"formula_{BASE}_p{pno+1}_{fid}.png")
+                # save the same page image as a "formula image" for convenience (user can crop later)
+                if SAVE_PAGE_IMAGES:
+                    # the page image is already on disk: share its inode instead of writing it again
+                    page_imgname = os.path.join(IMG_DIR, f"page_{pno+1}.png")
+                    if os.path.lexists(imgfile):
+                        os.remove(imgfile)
+                    try:
+                        os.link(page_imgname, imgfile)
+                    except OSError:
+                        shutil.copyfile(page_imgname, imgfile)
+                else:
+                    _write_bytes(imgfile, img_bytes)
+
+                # Compose placeholder and explanation block according to your rules:
+                out_f.write(sep)
+                out_f.write("<formula>")
+                sep = "\n\n"
+
+                # record
+                formula_records.append({
+                    "id": fid,
+                    "page": pno+1,
+                    "imgfile": imgfile,
+                    "ocr": ocr_trim,
+                    "lines": complex_formula_lines
+                })
+            out_f.flush()
+
+    # final report printed to console
+    print("✅ Processing complete.")
+    print(f"Input PDF: {INPUT_PDF}")
+    print(f"Output TXT: {OUT_TXT}")
+    print(f"Page images and formula images saved under: {IMG_DIR}")
+    print(f"Detected complex formula blocks: {len(formula_records)}")
+    for rec in formula_records:
+        print(f"  - Formula {rec['id']} on page {rec['page']}, image: {rec['imgfile']}, OCR len: {len(rec['ocr'])}")
+
+
+if __name__ == "__main__":
+    main()